@@ -1,5 +1,6 @@
 import os
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 import click
 import numpy as np
 import nibabel as nib
@@ -33,7 +34,7 @@ from monai_ex.utils import first
 from monai_ex.data import DataLoader
 
 
-def save_raw_image(data, meta_dict, out_dir, phase, dataset_name, batch_index, logger_name=None):
+def save_raw_image(data, meta_dict, out_dir, phase, dataset_name, batch_index, logger_name=None, executor=None):
     if isinstance(data, torch.Tensor):
         data = data.cpu().numpy()
 
@@ -41,6 +42,7 @@ def save_raw_image(data, meta_dict, out_dir, phase, dataset_name, batch_index, l
         logger = setup_logger(logger_name)
         logger.info(f"Saving {phase} image to {out_dir}...")
 
+    futures = []
     for i, patch in enumerate(data):
         out_fname = check_dir(
             out_dir,
@@ -49,7 +51,13 @@ def save_raw_image(data, meta_dict, out_dir, phase, dataset_name, batch_index, l
             f"{phase}-batch{batch_index}-{i}.nii.gz",
             isFile=True,
         )
-        nib.save(nib.Nifti1Image(patch.squeeze(), meta_dict["affine"][i]), out_fname)
+        # drop only the channel axis; squeeze() would also drop singleton spatial axes
+        nii = nib.Nifti1Image(patch[0] if patch.shape[0] == 1 else patch, meta_dict["affine"][i])
+        if executor is None:
+            nib.save(nii, out_fname)
+        else:  # gzip compression is slow, let the executor write while the next batch loads
+            futures.append(executor.submit(nib.save, nii, out_fname))
+    return futures
 
 
 def save_fnames(data, img_meta_key, image_fpath):
@@ -195,8 +203,13 @@ def check_data(ctx, **args):
 
     train_num = min(cargs.n_batch, len(train_dataset))
     valid_num = min(cargs.n_batch, len(valid_dataset))
-    train_dataloader = DataLoader(train_dataset, num_workers=1, batch_size=train_num, shuffle=True)
-    valid_dataloader = DataLoader(valid_dataset, num_workers=1, batch_size=valid_num, shuffle=False)
+    # decoding and augmentation dominate here, spread them over several workers;
+    # the train loader is iterated twice (first + full pass), so keep its workers alive
+    n_workers = min(8, os.cpu_count() or 1)
+    train_dataloader = DataLoader(
+        train_dataset, num_workers=n_workers, batch_size=train_num, shuffle=True, persistent_workers=True
+    )
+    valid_dataloader = DataLoader(valid_dataset, num_workers=n_workers, batch_size=valid_num, shuffle=False)
     train_data = first(train_dataloader)
 
     img_key = cfg.get_key("IMAGE")
@@ -220,71 +233,23 @@ def check_data(ctx, **args):
     else:
         overlap_m = draw_segmentation_masks
 
-    if len(shape) == 2 and channel == 1:
-        for phase, dataloader in {
-            Phases.TRAIN.value: train_dataloader,
-            Phases.VALID.value: valid_dataloader,
-        }.items():
-            for i, data in enumerate(tqdm(dataloader)):
-                bs = dataloader.batch_size
-                if exist_mask and overlap:
-                    mask_class_num = len(data[msk_key].unique())
-                    if mask_class_num > 2:
-                        msk = one_hot(data[msk_key], mask_class_num, dim=1).type(torch.bool)
-                else:
-                    msk = None
-
-                output_fpath = save_2d_image_grid(
-                    data[img_key],
-                    int(np.ceil(np.sqrt(bs))),
-                    cargs.out_dir,
-                    phase,
-                    cargs.data_list,
-                    i,
-                    overlap_method=overlap_m,
-                    mask=msk,
-                )
-
-                if cargs.save_raw:                  
-                    save_raw_image(
-                        data[img_key],
-                        data[f"{img_key}_meta_dict"],
-                        cargs.out_dir,
-                        phase,
-                        cargs.data_list,
-                        i,
-                        logger_name
-                    )
-
-                save_fnames(data, img_key + "_meta_dict", output_fpath)
-
-    elif len(shape) == 2 and channel > 1:
-        z_axis = 1
-        for phase, dataloader in {
-            Phases.TRAIN.value: train_dataloader,
-            Phases.VALID.value: valid_dataloader,
-        }.items():
-            for i, data in enumerate(tqdm(dataloader)):
-                bs = dataloader.batch_size
-                if exist_mask and overlap:
-                    mask_class_num = len(data[msk_key].unique())
-                    if mask_class_num > 2:
-                        msk = one_hot(data[msk_key], mask_class_num, dim=1).type(torch.bool)
-                else:
-                    msk = None
-
-                if cargs.save_raw:
-                    save_raw_image(
-                        data[img_key],
-                        data[f"{img_key}_meta_dict"],
-                        cargs.out_dir,
-                        phase,
-                        cargs.data_list,
-                        i,
-                        logger_name
-                    )
+    with ThreadPoolExecutor(max_workers=4) as writer:
+        pending_writes = []
+
+        if len(shape) == 2 and channel == 1:
+            for phase, dataloader in {
+                Phases.TRAIN.value: train_dataloader,
+                Phases.VALID.value: valid_dataloader,
+            }.items():
+                for i, data in enumerate(tqdm(dataloader)):
+                    bs = dataloader.batch_size
+                    if exist_mask and overlap:
+                        mask_class_num = len(data[msk_key].unique())
+                        if mask_class_num > 2:
+                            msk = one_hot(data[msk_key], mask_class_num, dim=1).type(torch.bool)
+                    else:
+                        msk = None
 
-                for ch_idx in range(channel):
                     output_fpath = save_2d_image_grid(
                         data[img_key],
                         int(np.ceil(np.sqrt(bs))),
@@ -292,56 +257,113 @@ def check_data(ctx, **args):
                         phase,
                         cargs.data_list,
                         i,
-                        z_axis,
-                        ch_idx,
                         overlap_method=overlap_m,
                         mask=msk,
                     )
 
-                save_fnames(data, img_key + "_meta_dict", output_fpath)
-
-    elif len(shape) == 3 and channel == 1:
-        z_axis = np.argmin(shape)
-        for phase, dataloader in {
-            Phases.TRAIN.value: train_dataloader,
-            Phases.VALID.value: valid_dataloader,
-        }.items():
-            for i, data in enumerate(tqdm(dataloader)):
-                bs = dataloader.batch_size
-                if exist_mask and overlap:
-                    mask_class_num = len(data[msk_key].unique())
-                    if mask_class_num > 2:
-                        msk = one_hot(data[msk_key], mask_class_num, dim=1).type(torch.bool)
-                else:
-                    msk = None
-
-                for slice_idx in range(shape[z_axis]):
-                    output_fpath = save_3d_image_grid(
-                        data[img_key],
-                        z_axis + 2,
-                        int(np.ceil(np.sqrt(bs))),
-                        cargs.out_dir,
-                        phase,
-                        cargs.data_list,
-                        i,
-                        slice_idx,
-                        multichannel=False,
-                        overlap_method=overlap_m,
-                        mask=msk,
-                    )
+                    if cargs.save_raw:                  
+                        pending_writes += save_raw_image(
+                            data[img_key],
+                            data[f"{img_key}_meta_dict"],
+                            cargs.out_dir,
+                            phase,
+                            cargs.data_list,
+                            i,
+                            logger_name,
+                            executor=writer,
+                        )
+
+                    save_fnames(data, img_key + "_meta_dict", output_fpath)
+
+        elif len(shape) == 2 and channel > 1:
+            z_axis = 1
+            for phase, dataloader in {
+                Phases.TRAIN.value: train_dataloader,
+                Phases.VALID.value: valid_dataloader,
+            }.items():
+                for i, data in enumerate(tqdm(dataloader)):
+                    bs = dataloader.batch_size
+                    if exist_mask and overlap:
+                        mask_class_num = len(data[msk_key].unique())
+                        if mask_class_num > 2:
+                            msk = one_hot(data[msk_key], mask_class_num, dim=1).type(torch.bool)
+                    else:
+                        msk = None
+
+                    if cargs.save_raw:
+                        pending_writes += save_raw_image(
+                            data[img_key],
+                            data[f"{img_key}_meta_dict"],
+                            cargs.out_dir,
+                            phase,
+                            cargs.data_list,
+                            i,
+                            logger_name,
+                            executor=writer,
+                        )
+
+                    for ch_idx in range(channel):
+                        output_fpath = save_2d_image_grid(
+                            data[img_key],
+                            int(np.ceil(np.sqrt(bs))),
+                            cargs.out_dir,
+                            phase,
+                            cargs.data_list,
+                            i,
+                            z_axis,
+                            ch_idx,
+                            overlap_method=overlap_m,
+                            mask=msk,
+                        )
+
+                    save_fnames(data, img_key + "_meta_dict", output_fpath)
+
+        elif len(shape) == 3 and channel == 1:
+            z_axis = np.argmin(shape)
+            for phase, dataloader in {
+                Phases.TRAIN.value: train_dataloader,
+                Phases.VALID.value: valid_dataloader,
+            }.items():
+                for i, data in enumerate(tqdm(dataloader)):
+                    bs = dataloader.batch_size
+                    if exist_mask and overlap:
+                        mask_class_num = len(data[msk_key].unique())
+                        if mask_class_num > 2:
+                            msk = one_hot(data[msk_key], mask_class_num, dim=1).type(torch.bool)
+                    else:
+                        msk = None
+
+                    for slice_idx in range(shape[z_axis]):
+                        output_fpath = save_3d_image_grid(
+                            data[img_key],
+                            z_axis + 2,
+                            int(np.ceil(np.sqrt(bs))),
+                            cargs.out_dir,
+                            phase,
+                            cargs.data_list,
+                            i,
+                            slice_idx,
+                            multichannel=False,
+                            overlap_method=overlap_m,
+                            mask=msk,
+                        )
                 
-                if cargs.save_raw:
-                    save_raw_image(
-                        data[img_key],
-                        data[f"{img_key}_meta_dict"],
-                        cargs.out_dir,
-                        phase,
-                        cargs.data_list,
-                        i,
-                        logger_name
-                    )
-
-                save_fnames(data, img_key + "_meta_dict", output_fpath)
-
-    else:
-        raise NotImplementedError(f"Not implement data-checking for shape of {shape}, channel of {channel}")
+                    if cargs.save_raw:
+                        pending_writes += save_raw_image(
+                            data[img_key],
+                            data[f"{img_key}_meta_dict"],
+                            cargs.out_dir,
+                            phase,
+                            cargs.data_list,
+                            i,
+                            logger_name,
+                            executor=writer,
+                        )
+
+                    save_fnames(data, img_key + "_meta_dict", output_fpath)
+
+        else:
+            raise NotImplementedError(f"Not implement data-checking for shape of {shape}, channel of {channel}")
+
+        for future in pending_writes:
+            future.result()
@@ -58,6 +58,8 @@ def get_default_setting(phase, **kwargs):
         "drop_last": drop_last,
         "num_workers": num_workers,
         "pin_memory": pin_memory,
+        # keep workers alive across epochs, validation loaders are re-iterated every epoch
+        "persistent_workers": num_workers > 0,
     }
 
 
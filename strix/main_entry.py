@@ -316,6 +316,12 @@ def train_cfg(**args):
     callback=input_cropsize,
     help="Use slidingwindow sampling",
 )
+@option(
+    "--sw-batch-size",
+    type=int,
+    default=None,
+    help="Number of windows per forward in slidingwindow inference (default: training batch size)",
+)
 @option("--with-label", is_flag=True, help="whether test data has label")
 @option("--save-image", is_flag=True, help="Save the tested image data")
 @option("--save-label", is_flag=True, help="Save the tested label data (image type)")
@@ -328,6 +334,7 @@ def train_cfg(**args):
     help="Target layer of saving latent code",
 )
 @option("--use-best-model", is_flag=True, help="Automatically select best model for testing")
+@option("--jit", is_flag=True, help="Script the loaded network with TorchScript for faster inference")
 @option("--smi", default=True, callback=print_smi, help="Print GPU usage")
 @option("--gpus", prompt="Choose GPUs[eg: 0]", type=str, help="The ID of active GPU")
 def test_cfg(**args):
@@ -386,6 +393,8 @@ def test_cfg(**args):
     configures["experiment_path"] = exp_dir
     configures["resample"] = True  # ! departure
     configures["slidingwindow"] = args["slidingwindow"]
+    configures["jit"] = args["jit"]
+    configures["sw_batch_size"] = args["sw_batch_size"]
     configures["save_latent"] = args["save_latent"]
     configures["target_layer"] = args["target_layer"]
     if args.get("crop_size", None):
@@ -1,6 +1,4 @@
-import copy
 import logging
-import re
 from types import SimpleNamespace
 from functools import partial
 from pathlib import Path
@@ -14,18 +12,20 @@ from strix.configures import config as cfg
 from strix.models.cnn.engines import ENSEMBLE_TEST_ENGINES, TEST_ENGINES, TRAIN_ENGINES
 from strix.models.cnn.engines.engine import StrixTestEngine, StrixTrainEngine
 from strix.models.cnn.engines.utils import (
+    get_ensemble_networks,
+    get_ensemble_weights,
     get_models,
     get_prepare_batch_fn,
+    get_simple_inferer,
     get_unsupervised_prepare_batch_fn,
 )
 from strix.models.cnn.utils import onehot_process
 from strix.utilities.enum import Phases
-from strix.utilities.transforms import decollate_transform_adaptor as DTA
+from strix.utilities.transforms import decollate_transform_adaptor as DTA, LastCallCache, BatchToHost
 from strix.utilities.utils import output_filename_check, setup_logger, get_attr_
 from monai_ex.engines import EnsembleEvaluator, SupervisedEvaluatorEx, SupervisedTrainerEx
 from monai_ex.handlers import (
     ROCAUC,
-    CheckpointLoaderEx,
     ClassificationSaverEx,
     EarlyStopHandler,
     LatentCodeSaver,
@@ -34,8 +34,6 @@ from monai_ex.handlers import (
 )
 from monai_ex.handlers import from_engine_ex as from_engine
 from monai_ex.handlers import stopping_fn_from_metric
-from monai_ex.inferers import SimpleInfererEx
-from monai_ex.metrics import DrawRocCurve
 from monai_ex.transforms import ActivationsD
 from monai_ex.transforms import AsDiscreteExD as AsDiscreteD
 from monai_ex.transforms import ComposeEx as Compose
@@ -67,9 +65,10 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
         logger_name = get_attr_(opts, 'logger_name', logger_name)
         freeze_mode = get_attr_(opts, "freeze_mode", None)
         freeze_params=get_attr_(opts, "freeze_params", None)
-        _image = cfg.get_key("image")
-        _label = cfg.get_key("label")
-        _loss = cfg.get_key("loss")
+        custom_keys = cfg.get_keys_dict()
+        _image = custom_keys["IMAGE"]
+        _label = custom_keys["LABEL"]
+        _loss = custom_keys["LOSS"]
 
         key_val_metric = ClassificationTrainEngine.get_metric(Phases.VALID, opts.output_nc, decollate)
         val_metric_name = list(key_val_metric.keys())[0]
@@ -118,13 +117,13 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             network=net,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(test_loader)),
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInfererEx(),
+            inferer=get_simple_inferer(opts, device),
             postprocessing=None,
             key_val_metric=key_val_metric,
             val_handlers=val_handlers,
             amp=opts.amp,
             decollate=decollate,
-            custom_keys=cfg.get_keys_dict(),
+            custom_keys=custom_keys,
         )
         evaluator.logger = setup_logger(logger_name)
 
@@ -172,14 +171,14 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             loss_function=loss,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(train_loader)),
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInfererEx(logger_name),
+            inferer=get_simple_inferer(opts, device, logger_name),
             postprocessing=None,
             key_train_metric=key_train_metric,
             # additional_metrics={"roccurve": add_roc_metric},
             train_handlers=train_handlers,
             amp=opts.amp,
             decollate=decollate,
-            custom_keys=cfg.get_keys_dict(),
+            custom_keys=custom_keys,
             ensure_dims=True,
         )
         self.logger = setup_logger(logger_name)
@@ -208,7 +207,7 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             return {f"{phase.value}_auc_{suffix}": key_val_metric} if suffix else {f"{phase.value}_auc": key_val_metric}
 
     @staticmethod
-    def get_acc_post_transform(output_nc, decollate, item_index):
+    def get_activate_post_transform(output_nc, decollate, item_index):
         is_multilabel = output_nc > 1
         _pred = cfg.get_key("pred")
         _label = cfg.get_key("label")
@@ -217,6 +216,25 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             ActivationsD(keys=_pred, softmax=True) if is_multilabel else ActivationsD(keys=_pred, sigmoid=True)
         )
 
+        select_item_transform = (
+            [DTA(GetItemD(keys=[_pred, _label], index=item_index))] if item_index is not None else []
+        )
+        transforms = select_item_transform + [
+            DTA(EnsureTypeD(keys=[_pred, _label], device="cpu")),
+            DTA(activate_transform),
+        ]
+
+        return Compose(transforms, map_items=not decollate)
+
+    @staticmethod
+    def get_acc_post_transform(output_nc, decollate, item_index, activate_transform=None):
+        is_multilabel = output_nc > 1
+        _pred = cfg.get_key("pred")
+        _label = cfg.get_key("label")
+
+        if activate_transform is None:
+            activate_transform = ClassificationTrainEngine.get_activate_post_transform(output_nc, decollate, item_index)
+
         discrete_transform = (
             AsDiscreteD(keys=_pred, argmax=True, to_onehot=output_nc, dim=1, keepdim=True)
             if is_multilabel
@@ -229,12 +247,8 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             else from_engine([_pred, _label], ensure_dim=decollate)
         )
 
-        select_item_transform = (
-            [DTA(GetItemD(keys=[_pred, _label], index=item_index))] if item_index is not None else []
-        )
-        transforms = select_item_transform + [
-            DTA(EnsureTypeD(keys=[_pred, _label], device="cpu")),
-            DTA(activate_transform),
+        transforms = [
+            activate_transform,
             DTA(discrete_transform),
             onehot_transform,
         ]
@@ -242,14 +256,13 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
         return Compose(transforms, map_items=not decollate)
 
     @staticmethod
-    def get_auc_post_transform(output_nc, decollate, item_index):
+    def get_auc_post_transform(output_nc, decollate, item_index, activate_transform=None):
         is_multilabel = output_nc > 1
         _pred = cfg.get_key("pred")
         _label = cfg.get_key("label")
 
-        activate_transform = (
-            ActivationsD(keys=_pred, softmax=True) if is_multilabel else ActivationsD(keys=_pred, sigmoid=True)
-        )
+        if activate_transform is None:
+            activate_transform = ClassificationTrainEngine.get_activate_post_transform(output_nc, decollate, item_index)
 
         discrete_transform = AsDiscreteD(keys=_pred, argmax=True, to_onehot=False) if is_multilabel else lambda x: x
 
@@ -259,13 +272,8 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             else from_engine([_pred, _label], ensure_dim=decollate)
         )
 
-        select_item_transform = (
-            [DTA(GetItemD(keys=[_pred, _label], index=item_index))] if item_index is not None else []
-        )
-
-        transforms = select_item_transform + [
-            DTA(EnsureTypeD(keys=[_pred, _label], device="cpu")),
-            DTA(activate_transform),
+        transforms = [
+            activate_transform,
             DTA(discrete_transform),
             onehot_transform,
         ]
@@ -296,10 +304,11 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
         output_latent_code = kwargs.get("output_latent_code", False)
         target_latent_layer = kwargs.get("target_latent_layer", None)
         decollate = True
-        _image = cfg.get_key("image")
-        _label = cfg.get_key("label")
-        _pred = cfg.get_key("pred")
-        _acti = cfg.get_key("forward")
+        custom_keys = cfg.get_keys_dict()
+        _image = custom_keys["IMAGE"]
+        _label = custom_keys["LABEL"]
+        _pred = custom_keys["PRED"]
+        _acti = custom_keys["FORWARD"]
 
         model_path = opts.model_path[0] if isinstance(opts.model_path, (list, tuple)) else opts.model_path
         logger_name = get_attr_(opts, 'logger_name', logger_name)
@@ -310,10 +319,18 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
         else:
             prepare_batch_fn = get_unsupervised_prepare_batch_fn(opts, _image, multi_input_keys)
 
-        key_val_metric = ClassificationTestEngine.get_metric(opts.phase, opts.output_nc, decollate, metric_names="acc")
+        metric_post_transforms = ClassificationTestEngine.get_metric_post_transforms(opts.output_nc, decollate)
+        key_val_metric = ClassificationTestEngine.get_metric(
+            opts.phase, opts.output_nc, decollate, metric_names="acc", post_transforms=metric_post_transforms
+        )
         key_metric_name = list(key_val_metric.keys())
         additional_val_metrics = ClassificationTestEngine.get_metric(
-            opts.phase, opts.output_nc, decollate, output_dir=opts.out_dir, metric_names=["auc", "prec", "recall", "roc"]
+            opts.phase,
+            opts.output_nc,
+            decollate,
+            output_dir=opts.out_dir,
+            metric_names=["auc", "prec", "recall", "roc"],
+            post_transforms=metric_post_transforms,
         )
         additional_metric_names = list(additional_val_metrics.keys())
 
@@ -342,14 +359,14 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             val_data_loader=test_loader,
             network=net,
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInfererEx(),  # SlidingWindowClassify(roi_size=opts.crop_size, sw_batch_size=4, overlap=0.3),
+            inferer=get_simple_inferer(opts, device, inference_mode=True),  # SlidingWindowClassify(roi_size=opts.crop_size, sw_batch_size=4, overlap=0.3),
             postprocessing=None,  # post_transforms,
             val_handlers=handlers,
             key_val_metric=key_val_metric if is_supervised else None,
             additional_metrics=additional_val_metrics if is_supervised else None,
             amp=opts.amp,
             decollate=decollate,
-            custom_keys=cfg.get_keys_dict(),
+            custom_keys=custom_keys,
             output_latent_code=output_latent_code,
             target_latent_layer=target_latent_layer,
         )
@@ -366,36 +383,39 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
         output_dir = kwargs.get("output_dir", None)
         metric_names = kwargs.get("metric_names", "acc")
         metric_names = ensure_tuple(metric_names)
+        post_transforms = kwargs.get("post_transforms", None)
+        if post_transforms is None:
+            post_transforms = ClassificationTestEngine.get_metric_post_transforms(output_nc, decollate, item_index)
+        acc_transform, auc_transform = post_transforms["acc"], post_transforms["auc"]
 
         is_multilabel = output_nc > 1
+
         metrics = {}
         for name in metric_names:
             metric_name = ClassificationTestEngine.get_key_metric_name(phase, suffix, metric_name=name)
             if name == "acc":
-                transform = ClassificationTrainEngine.get_acc_post_transform(output_nc, decollate, item_index)
-                m = {metric_name: Accuracy(output_transform=transform, is_multilabel=is_multilabel)}
+                m = {metric_name: Accuracy(output_transform=acc_transform, is_multilabel=is_multilabel)}
             elif name == "auc":
-                transform = ClassificationTrainEngine.get_auc_post_transform(output_nc, decollate, item_index)
-                m = {metric_name: ROCAUC(output_transform=transform)}
+                m = {metric_name: ROCAUC(output_transform=auc_transform)}
             elif name == "prec":
-                transform = ClassificationTrainEngine.get_acc_post_transform(output_nc, decollate, item_index)
                 m = {
                     metric_name: Precision(
-                        output_transform=transform, average=is_multilabel, is_multilabel=is_multilabel
+                        output_transform=acc_transform, average=is_multilabel, is_multilabel=is_multilabel
                     )
                 }
             elif name == "recall":
-                transform = ClassificationTrainEngine.get_acc_post_transform(output_nc, decollate, item_index)
                 m = {
                     metric_name: Recall(
-                        output_transform=transform, average=is_multilabel, is_multilabel=is_multilabel
+                        output_transform=acc_transform, average=is_multilabel, is_multilabel=is_multilabel
                     )
                 }
             elif name == "roc":
-                transform = ClassificationTrainEngine.get_auc_post_transform(output_nc, decollate, item_index)
+                # plotting metric, only imported when a roc curve is requested
+                from monai_ex.metrics import DrawRocCurve
+
                 m = {
                     metric_name: DrawRocCurve(
-                        save_dir=output_dir, output_transform=transform, is_multilabel=is_multilabel
+                        save_dir=output_dir, output_transform=auc_transform, is_multilabel=is_multilabel
                     )
                 }
             else:
@@ -405,6 +425,26 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             metrics.update(m)
         return metrics
 
+    @staticmethod
+    def get_metric_post_transforms(output_nc: int, decollate: bool, item_index: Optional[int] = None):
+        """Cached acc and auc post transforms sharing one activation step.
+
+        Metrics sharing a post transform run it once per iteration. Pass the result as
+        `post_transforms` to every `get_metric` call of an engine, so that the key and
+        the additional metrics also share it.
+        """
+        activate_transform = LastCallCache(
+            ClassificationTrainEngine.get_activate_post_transform(output_nc, decollate, item_index)
+        )
+        return {
+            "acc": LastCallCache(
+                ClassificationTrainEngine.get_acc_post_transform(output_nc, decollate, item_index, activate_transform)
+            ),
+            "auc": LastCallCache(
+                ClassificationTrainEngine.get_auc_post_transform(output_nc, decollate, item_index, activate_transform)
+            ),
+        }
+
     @staticmethod
     def get_key_metric_name(phase: Phases, suffix: str = '', **kwargs):
         metric_name = kwargs.get("metric_name", "acc")
@@ -487,7 +527,7 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             select_item_transform = []
 
         if output_nc == 1:
-            return Compose(
+            item_transform = Compose(
                 select_item_transform + [
                     EnsureTypeD(keys=pred_label_key),
                     ActivationsD(keys=_pred, sigmoid=True),
@@ -497,17 +537,19 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
                 first=False,
             )
         else:
-            return Compose(
+            # argmax is unchanged by softmax, so discrete outputs skip the activation
+            item_transform = Compose(
                 select_item_transform + [
                     EnsureTypeD(keys=pred_label_key),
-                    ActivationsD(keys=_pred, softmax=True),
                     AsDiscreteD(keys=_pred, argmax=True, to_onehot=None)  # ? dim=1, keepdim=True
                     if discrete
-                    else lambda x: x,
+                    else ActivationsD(keys=_pred, softmax=True),
                     from_engine(_pred),
                 ],
                 first=False,
             )
+        # the decollated items are mapped by `item_transform`, BatchToHost gets the whole list
+        return Compose([item_transform, BatchToHost()], map_items=False)
 
 
 @ENSEMBLE_TEST_ENGINES.register("classification")
@@ -525,7 +567,6 @@ class ClassificationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
         model_list = opts.model_path
         logger_name = get_attr_(opts, 'logger_name', logger_name)
         self.logger = setup_logger(logger_name)
-        float_regex = r"=(-?\d+\.\d+).pt"
         multi_input_keys = kwargs.get("multi_input_keys", None)
         multi_output_keys = kwargs.get("multi_output_keys", None)
         _image = cfg.get_key("image")
@@ -549,12 +590,10 @@ class ClassificationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             )
         print(f"Using models: {[m.name for m in model_list]}")
 
-        nets = [copy.deepcopy(net),] * len(model_list)
-        for net, m in zip(nets, model_list):
-            CheckpointLoaderEx(load_path=str(m), load_dict={"net": net}, name=logger_name)(None)
+        nets = get_ensemble_networks(net, model_list, device, logger_name)
 
         pred_keys = [f"{_pred}{i}" for i in range(len(model_list))]
-        w_ = [float(re.search(float_regex, m.name).group(1)) for m in best_models] if use_best_model else None
+        w_ = get_ensemble_weights(model_list) if use_best_model else None
 
         post_transforms = MeanEnsembleD(
             keys=pred_keys,
@@ -562,16 +601,24 @@ class ClassificationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             weights=w_,
         )
 
-        key_val_metric = ClassificationTestEngine.get_metric(opts.phase, opts.output_nc, decollate, metric_names="acc")
+        metric_post_transforms = ClassificationTestEngine.get_metric_post_transforms(opts.output_nc, decollate)
+        key_val_metric = ClassificationTestEngine.get_metric(
+            opts.phase, opts.output_nc, decollate, metric_names="acc", post_transforms=metric_post_transforms
+        )
         additional_val_metrics = ClassificationTestEngine.get_metric(
-            opts.phase, opts.output_nc, decollate, output_dir=opts.out_dir, metric_names=["auc", "prec", "recall", "roc"]
+            opts.phase,
+            opts.output_nc,
+            decollate,
+            output_dir=opts.out_dir,
+            metric_names=["auc", "prec", "recall", "roc"],
+            post_transforms=metric_post_transforms,
         )
 
         handlers = StrixTestEngine.get_basic_handlers(
             phase=opts.phase,
             out_dir=opts.out_dir,
-            model_path=best_models,
-            load_dict=[{"net": net} for net in nets],
+            model_path=[],  # checkpoints are already loaded above
+            load_dict=[],
             logger_name=logger_name,
             stats_dicts={"Metrics": lambda x: None},
             save_image=opts.save_image,
@@ -600,7 +647,7 @@ class ClassificationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             networks=nets,
             pred_keys=pred_keys,
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInfererEx(),
+            inferer=get_simple_inferer(opts, device, inference_mode=True),
             postprocessing=post_transforms,
             key_val_metric=key_val_metric,
             additional_metrics=additional_val_metrics,
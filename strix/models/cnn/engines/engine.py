@@ -1,9 +1,15 @@
+import logging
 import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
 from typing import Callable, Dict, Optional, Sequence, Union
 
 import torch
+import ignite.distributed as idist
+from ignite.engine import Engine, Events
+from ignite.handlers import Checkpoint
+from ignite.handlers.checkpoint import BaseSaveHandler
 
 from strix.configures import config as cfg
 from strix.utilities.utils import output_filename_check
@@ -23,6 +29,93 @@ from monai_ex.utils import ensure_list
 from torch.utils.data import DataLoader
 
 
+def _to_cpu(data):
+    if isinstance(data, torch.Tensor):
+        return data.detach().to("cpu", copy=True)
+    if isinstance(data, dict):
+        return {k: _to_cpu(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return type(data)(_to_cpu(v) for v in data)
+    return data
+
+
+class AsyncSaveHandler(BaseSaveHandler):
+    """Wrap an ignite save handler so checkpoint files are written by a background thread.
+
+    The checkpoint is snapshotted to CPU before returning, so training can keep updating
+    the weights. Writes and removals run in order on a single worker; an error from a
+    previous write is logged when it happens and raised on the next save or flush.
+    `dirname` is forwarded from the wrapped handler.
+    """
+
+    def __init__(self, save_handler: BaseSaveHandler, logger: Optional[logging.Logger] = None):
+        self.save_handler = save_handler
+        self.logger = logger or logging.getLogger(__name__)
+        self._executor = None
+        self._pending = None
+
+    @property
+    def dirname(self):
+        return self.save_handler.dirname
+
+    def attach(self, engine: Engine) -> None:
+        """Flush the pending write when `engine` stops, and shut the worker down once it ends."""
+        engine.add_event_handler(Events.TERMINATE, self.wait)
+        engine.add_event_handler(Events.COMPLETED, self.close)
+        engine.add_event_handler(Events.EXCEPTION_RAISED, self._close_on_exception)
+
+    def wait(self, *args):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def close(self, *args):
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _close_on_exception(self, engine: Engine, e: BaseException):
+        # a failed write shows up as the context of `e`
+        try:
+            self.close()
+        finally:
+            raise e
+
+    def _log_failure(self, future):
+        if future.exception() is not None:
+            self.logger.error(f"Checkpoint write failed: {future.exception()}")
+
+    def _submit(self, fn, *args):
+        self.wait()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = self._executor.submit(fn, *args)
+        self._pending.add_done_callback(self._log_failure)
+
+    def __call__(self, checkpoint, filename, metadata=None):
+        self._submit(self.save_handler, _to_cpu(checkpoint), filename, metadata)
+
+    def remove(self, filename):
+        self._submit(self.save_handler.remove, filename)
+
+
+class AsyncCheckpointSaver(CheckpointSaverEx):
+    """CheckpointSaverEx whose checkpoint files are written in the background.
+
+    Pending writes are flushed when the attached engine terminates, completes or raises.
+    """
+
+    def attach(self, engine: Engine) -> None:
+        super().attach(engine)
+        for checkpoint in vars(self).values():
+            if isinstance(checkpoint, Checkpoint) and isinstance(checkpoint.save_handler, BaseSaveHandler):
+                checkpoint.save_handler = AsyncSaveHandler(checkpoint.save_handler, getattr(self, "logger", None))
+                checkpoint.save_handler.attach(engine)
+
+
 class StrixTrainEngine(ABC):
     """A base class for strix inner train engines."""
 
@@ -69,6 +162,8 @@ class StrixTrainEngine(ABC):
         freeze_params: Optional[tuple] = None,
     ):
         handlers = []
+        # Only rank 0 writes checkpoints and tensorboard records in distributed training.
+        is_main = idist.get_rank() == 0
 
         if stats_dicts is not None:
             for key, output_transform_fn in stats_dicts.items():
@@ -78,15 +173,18 @@ class StrixTrainEngine(ABC):
                         output_transform=output_transform_fn,
                         name=logger_name,
                     ),
-                    TensorBoardStatsHandler(
-                        summary_writer=tb_summary_writer,
-                        tag_name=key,
-                        output_transform=output_transform_fn,
-                    ),
                 ]
-        if save_checkpoint:
+                if is_main:
+                    handlers += [
+                        TensorBoardStatsHandler(
+                            summary_writer=tb_summary_writer,
+                            tag_name=key,
+                            output_transform=output_transform_fn,
+                        ),
+                    ]
+        if save_checkpoint and is_main:
             handlers += [
-                CheckpointSaverEx(
+                AsyncCheckpointSaver(
                     save_dir=model_dir / "Checkpoint",
                     save_dict={"net": net, "optim": optimizer},
                     save_interval=checkpoint_save_interval,
@@ -94,7 +192,7 @@ class StrixTrainEngine(ABC):
                     n_saved=ckeckpoint_n_saved,
                 ),
             ]
-        if save_bestmodel:
+        if save_bestmodel and is_main:
             handlers += [
                 CheckpointSaverEx(
                     save_dir=model_dir / "Best_Models",
@@ -105,7 +203,7 @@ class StrixTrainEngine(ABC):
                 )
             ]
 
-        if tensorboard_image_kwargs is not None:
+        if tensorboard_image_kwargs is not None and is_main:
             tb_img_kwargs = ensure_list(tensorboard_image_kwargs)
             tb_img_names = ensure_list(tensorboard_image_names)
             if len(tb_img_kwargs) != len(tb_img_names):
@@ -124,7 +222,7 @@ class StrixTrainEngine(ABC):
                 if kwargs is not None
             ]
 
-        if dump_tensorboard:
+        if dump_tensorboard and is_main:
             handlers += [
                 TensorboardDumper(
                     log_dir=tb_summary_writer.log_dir,
@@ -133,7 +231,7 @@ class StrixTrainEngine(ABC):
                 ),
             ]
 
-        if graph_batch_transform:
+        if graph_batch_transform and is_main:
             handlers += [
                 TensorboardGraphHandler(
                     net=net,
@@ -143,7 +241,7 @@ class StrixTrainEngine(ABC):
                 ),
             ]
 
-        if record_nni:
+        if record_nni and is_main:
             handlers += [NNIReporterHandler(**nni_kwargs)]
 
         if freeze_mode:
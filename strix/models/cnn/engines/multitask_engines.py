@@ -1,11 +1,9 @@
-import re
-import copy
 from pathlib import Path 
 import torch
 import logging
 from strix.configures import config as cfg
 from strix.models.cnn.engines import TEST_ENGINES, TRAIN_ENGINES, StrixTestEngine, StrixTrainEngine, ENSEMBLE_TEST_ENGINES
-from strix.models.cnn.engines.utils import get_prepare_batch_fn, get_unsupervised_prepare_batch_fn, get_models
+from strix.models.cnn.engines.utils import get_ensemble_networks, get_ensemble_weights, get_prepare_batch_fn, get_unsupervised_prepare_batch_fn, get_models
 from strix.utilities.utils import setup_logger, output_filename_check, get_attr_
 from strix.utilities.enum import Phases
 from monai_ex.engines import MultiTaskTrainer, SupervisedEvaluatorEx, EnsembleEvaluatorEx
@@ -271,7 +269,6 @@ class MultitaskEnsembleTestEngine(StrixTestEngine, EnsembleEvaluatorEx):
         use_best_model = kwargs.get("best_val_model", True)
         crop_size = get_attr_(opts, "crop_size", None)
         use_slidingwindow = opts.slidingwindow
-        float_regex = r"=(-?\d+\.\d+).pt"
         decollate = True
         is_supervised = opts.phase == Phases.TEST_IN
         logger_name = get_attr_(opts, 'logger_name', logger_name)
@@ -302,9 +299,9 @@ class MultitaskEnsembleTestEngine(StrixTestEngine, EnsembleEvaluatorEx):
             )
         self.logger.info(f"Using models: {[m.name for m in best_models]}")
 
-        nets = [copy.deepcopy(net),] * len(best_models)
+        nets = get_ensemble_networks(net, best_models, device, logger_name)
         pred_keys = [f"{_pred}{i}" for i in range(len(best_models))]
-        w_ = [float(re.search(float_regex, m.name).group(1)) for m in best_models] if use_best_model else None
+        w_ = get_ensemble_weights(best_models) if use_best_model else None
 
         post_transforms = MultitaskMeanEnsembleD(keys=pred_keys, output_key=_pred, task_num=2, weights=w_)
 
@@ -324,8 +321,8 @@ class MultitaskEnsembleTestEngine(StrixTestEngine, EnsembleEvaluatorEx):
         handlers = StrixTestEngine.get_basic_handlers(
             phase=opts.phase,
             out_dir=opts.out_dir,
-            model_path=best_models,
-            load_dict=[{"net": net} for net in nets],
+            model_path=[],  # checkpoints are already loaded above
+            load_dict=[],
             logger_name=logger_name,
             stats_dicts={"Metrics": lambda x: None},
             save_image=opts.save_image,
@@ -1,21 +1,29 @@
 from types import SimpleNamespace
 from typing import Optional, Union, Sequence, Dict
-import re
-import copy
 from pathlib import Path
+from functools import lru_cache
 
 import torch
 from torch.utils.data import DataLoader 
+from ignite.engine import Events
 from strix.models.cnn.engines import TRAIN_ENGINES, TEST_ENGINES, ENSEMBLE_TEST_ENGINES
 from strix.models.cnn.engines.utils import (
+    get_ensemble_networks,
+    get_ensemble_weights,
     get_models,
     get_prepare_batch_fn,
     get_unsupervised_prepare_batch_fn,
     get_dice_metric_transform_fn,
+    compile_network,
+    get_simple_inferer,
+    InferenceModeInferer,
+    jit_network,
+    StreamedEnsembleInferer,
 )
 from strix.utilities.utils import setup_logger, output_filename_check, get_attr_
 from strix.utilities.enum import Phases
 from strix.utilities.transforms import decollate_transform_adaptor as DTA
+from strix.utilities.prefetcher import CUDAPrefetcher
 from strix.configures import config as cfg
 from strix.models.cnn.engines.engine import StrixTrainEngine, StrixTestEngine
 
@@ -42,6 +50,17 @@ from monai_ex.handlers import (
 )
 
 
+def _device_keys(image_key, label_key, multi_input_keys, multi_output_keys):
+    """Batch keys that prepare_batch moves to the device."""
+    return (*(multi_input_keys or [image_key]), *(multi_output_keys or [label_key]))
+
+
+@lru_cache(maxsize=8)
+def _get_dice_post_transform(output_nc, decollate, item_index, pred_key, label_key):
+    """Dice post transforms hold no state, so engines built with the same settings share one."""
+    return SegmentationTrainEngine._build_dice_post_transform(output_nc, decollate, item_index, pred_key, label_key)
+
+
 @TRAIN_ENGINES.register("segmentation")
 class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
     def __init__(
@@ -68,6 +87,12 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
         decollate = False
         logger_name = get_attr_(opts, 'logger_name', logger_name)
 
+        if opts.amp and get_attr_(opts, "tensor_dim", None) == "2D" and torch.device(device).type == "cuda":
+            # NHWC weights let cuDNN pick tensor-core conv kernels under autocast
+            net.to(memory_format=torch.channels_last)
+        # checkpoint handlers keep the eager `net`, whose state_dict keys are unprefixed
+        model = compile_network(net, setup_logger(logger_name)) if get_attr_(opts, "compile", False) else net
+
         val_metric = SegmentationTrainEngine.get_metric(Phases.VALID, output_nc=opts.output_nc, decollate=decollate)
         train_metric = SegmentationTrainEngine.get_metric(Phases.TRAIN, output_nc=opts.output_nc, decollate=decollate)
         val_metric_name = list(val_metric.keys())[0]
@@ -110,11 +135,11 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
 
         evaluator = SupervisedEvaluatorEx(
             device=device,
-            val_data_loader=test_loader,
-            network=net,
+            val_data_loader=CUDAPrefetcher(test_loader, device, _device_keys(_image, _label, multi_input_keys, multi_output_keys)),
+            network=model,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(test_loader)),
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInferer(),
+            inferer=get_simple_inferer(opts, device),
             postprocessing=None,
             key_val_metric=val_metric,
             val_handlers=val_handlers,
@@ -160,12 +185,12 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             device=device,
             max_epochs=opts.n_epoch,
             train_data_loader=train_loader,
-            network=net,
+            network=model,
             optimizer=optim,
             loss_function=loss,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(train_loader)),
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInferer(),
+            inferer=get_simple_inferer(opts, device),
             postprocessing=None,
             key_train_metric=train_metric,
             train_handlers=train_handlers,
@@ -184,9 +209,11 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
 
     @staticmethod
     def get_dice_post_transform(output_nc: int, decollate: bool, item_index: Optional[int] = None):
-        _pred = cfg.get_key("pred")
-        _label = cfg.get_key("label")
+        # keys are part of the cache key, since they can be changed with cfg.set_key
+        return _get_dice_post_transform(output_nc, decollate, item_index, cfg.get_key("pred"), cfg.get_key("label"))
 
+    @staticmethod
+    def _build_dice_post_transform(output_nc: int, decollate: bool, item_index: Optional[int], _pred: str, _label: str):
         select_item_transform = (
             [DTA(GetItemD(keys=[_pred, _label], index=item_index))] if item_index is not None else []
         )
@@ -211,7 +238,7 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             return Compose(
                 select_item_transform
                 + [
-                    DTA(ActivationsD(keys=_pred, softmax=True)),
+                    # softmax does not change the argmax
                     DTA(AsDiscreteD(keys=_pred, argmax=True, to_onehot=output_nc))
                     if decollate
                     else AsDiscreteD(keys=_pred, argmax=True, to_onehot=output_nc, dim=1, keepdim=True),
@@ -232,10 +259,11 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
         _image = cfg.get_key("image")
         _label = label_key if label_key else cfg.get_key("label")
         _pred = cfg.get_key("pred")
+        # no identity placeholders, every transform in the list is a call per batch
+        select_item_transform = [DTA(GetItemD(keys=_pred, index=item_index))] if item_index is not None else []
         if output_nc == 1:
             post_transform = Compose(
-                [
-                    DTA(GetItemD(keys=_pred, index=item_index)) if item_index is not None else lambda x: x,
+                select_item_transform + [
                     DTA(ActivationsD(keys=_pred, sigmoid=True)),
                     DTA(AsDiscreteD(keys=_pred, threshold=0.5)),
                     from_engine(_pred)
@@ -244,9 +272,7 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             )
         else:
             post_transform = Compose(
-                [
-                    DTA(GetItemD(keys=_pred, index=item_index)) if item_index is not None else lambda x: x,
-                    DTA(ActivationsD(keys=_pred, softmax=True)),
+                select_item_transform + [
                     DTA(AsDiscreteD(keys=_pred, argmax=True, to_onehot=output_nc))
                     if decollate 
                     else AsDiscreteD(keys=_pred, argmax=True, to_onehot=output_nc, dim=1, keepdim=True),
@@ -317,14 +343,18 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             prepare_batch_fn = get_prepare_batch_fn(opts, _image, _label, multi_input_keys, multi_output_keys)
 
         if use_slidingwindow:
-            inferer = SlidingWindowInferer(roi_size=crop_size, sw_batch_size=opts.n_batch, overlap=0.5)
+            inferer = SlidingWindowInferer(
+                roi_size=crop_size, sw_batch_size=get_attr_(opts, "sw_batch_size", None) or opts.n_batch, overlap=0.5
+            )
         else:
             inferer = SimpleInferer()
+        inferer = InferenceModeInferer(inferer)
 
         SupervisedEvaluatorEx.__init__(
             self,
             device=device,
-            val_data_loader=test_loader,
+            val_data_loader=CUDAPrefetcher(test_loader, device, _device_keys(_image, _label, multi_input_keys, multi_output_keys)),
+            epoch_length=len(test_loader),  # required for non-DataLoader iterables
             network=net,
             prepare_batch=prepare_batch_fn,
             inferer=inferer,
@@ -336,6 +366,15 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             custom_keys=cfg.get_keys_dict()
         )
 
+        if get_attr_(opts, "jit", False):
+            # registered after the checkpoint loaders, so the loaded weights get scripted
+            def _jit_network(engine):
+                engine.network = jit_network(engine.network, engine.logger)
+
+            self.add_event_handler(Events.STARTED, _jit_network)
+        elif get_attr_(opts, "compile", False):
+            self.network = compile_network(net, self.logger)
+
     @staticmethod
     def get_metric(
         phase: Phases,
@@ -438,18 +477,18 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
 
         if output_nc == 1:
             return Compose(
-                select_item_transform + [
-                    DTA(ActivationsD(keys=_pred, sigmoid=True)),
-                    DTA(AsDiscreteD(keys=_pred, threshold=logit_thresh)) if discrete else lambda x: x,
-                    from_engine(_pred),
-                ],
+                select_item_transform
+                + [DTA(ActivationsD(keys=_pred, sigmoid=True))]
+                + ([DTA(AsDiscreteD(keys=_pred, threshold=logit_thresh))] if discrete else [])
+                + [from_engine(_pred)],
                 map_items=not decollate,
             )
         else:
             return Compose(
                 select_item_transform + [
-                    DTA(ActivationsD(keys=_pred, softmax=True)),
-                    DTA(AsDiscreteD(keys=_pred, argmax=True, to_onehot=None)) if discrete else lambda x: x,
+                    DTA(AsDiscreteD(keys=_pred, argmax=True, to_onehot=None))
+                    if discrete
+                    else DTA(ActivationsD(keys=_pred, softmax=True)),
                     from_engine(_pred),
                 ],
                 map_items=not decollate,
@@ -474,7 +513,6 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
         self.logger = setup_logger(logger_name)
         crop_size = get_attr_(opts, "crop_size", None)
         use_slidingwindow = opts.slidingwindow
-        float_regex = r"=(-?\d+\.\d+).pt"
         decollate = True
         if is_intra_ensemble:
             raise NotImplementedError("Intra ensemble testing not tested yet")
@@ -503,10 +541,10 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             )
         self.logger.info(f"Using models: {[m.name for m in best_models]}")
 
-        nets = [copy.deepcopy(net),] * len(best_models)
+        nets = get_ensemble_networks(net, best_models, device, logger_name)
 
         pred_keys = [f"{_pred}{i}" for i in range(len(best_models))]
-        w_ = [float(re.search(float_regex, m.name).group(1)) for m in best_models] if use_best_model else None
+        w_ = get_ensemble_weights(best_models) if use_best_model else None
 
         post_transforms = MeanEnsembleD(
             keys=pred_keys,
@@ -521,8 +559,8 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
         handlers = StrixTestEngine.get_basic_handlers(
             phase=opts.phase,
             out_dir=opts.out_dir,
-            model_path=best_models,
-            load_dict=[{"net": net} for net in nets],
+            model_path=[],  # checkpoints are already loaded above
+            load_dict=[],
             logger_name=logger_name,
             stats_dicts={val_metric_name: lambda x: None},
             save_image=opts.save_image,
@@ -545,14 +583,19 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             raise ValueError(f"Got unexpected phase here {opts.phase}, expect testing.")
 
         if use_slidingwindow:
-            inferer = SlidingWindowInferer(roi_size=crop_size, sw_batch_size=opts.n_batch, overlap=0.5)
+            inferer = SlidingWindowInferer(
+                roi_size=crop_size, sw_batch_size=get_attr_(opts, "sw_batch_size", None) or opts.n_batch, overlap=0.5
+            )
         else:
             inferer = SimpleInferer()
+        # folds run concurrently on their own streams
+        inferer = StreamedEnsembleInferer(InferenceModeInferer(inferer))
 
         EnsembleEvaluator.__init__(
             self,
             device=device,
-            val_data_loader=test_loader,
+            val_data_loader=CUDAPrefetcher(test_loader, device, _device_keys(_image, _label, multi_input_keys, multi_output_keys)),
+            epoch_length=len(test_loader),  # required for non-DataLoader iterables
             networks=nets,
             pred_keys=pred_keys,
             prepare_batch=prepare_batch_fn,
@@ -563,3 +606,9 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             amp=opts.amp,
             decollate=decollate,
         )
+
+        if get_attr_(opts, "jit", False):
+            def _jit_networks(engine):
+                engine.networks = tuple(jit_network(n, engine.logger) for n in engine.networks)
+
+            self.add_event_handler(Events.STARTED, _jit_networks)
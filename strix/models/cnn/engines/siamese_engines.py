@@ -1,5 +1,6 @@
 import os
 from functools import partial
+from operator import itemgetter
 from ignite import engine
 from monai_ex import handlers
 
@@ -52,6 +53,10 @@ from monai_ex.handlers import (
 )
 
 
+def _no_batch(batch):
+    return None, None
+
+
 @TRAIN_ENGINES.register("siamese")
 def build_siamese_engine(**kwargs):
     opts = kwargs["opts"]
@@ -99,7 +104,7 @@ def build_siamese_engine(**kwargs):
         TensorBoardStatsHandler(
             summary_writer=writer,
             tag_name='val_loss',
-            output_transform=lambda x: x[loss_]
+            output_transform=itemgetter(loss_)
         ),
         CheckpointSaverEx(
             save_dir=model_dir,
@@ -110,8 +115,8 @@ def build_siamese_engine(**kwargs):
         ),
         TensorBoardImageHandlerEx(
             summary_writer=writer,
-            batch_transform=lambda x: (None, None),
-            output_transform=lambda x: x[label_],
+            batch_transform=_no_batch,
+            output_transform=itemgetter(label_),
             max_channels=3,
             prefix_name='Val'
         )
@@ -127,10 +132,11 @@ def build_siamese_engine(**kwargs):
             SqueezeDimD(keys=pred_)
         ])
 
+    onehot_transform = partial(output_onehot_transform, n_classes=opts.output_nc)
     if is_multilabel:
-        key_val_metric = Accuracy(output_transform=partial(output_onehot_transform,n_classes=opts.output_nc), is_multilabel=is_multilabel)
+        key_val_metric = Accuracy(output_transform=onehot_transform, is_multilabel=is_multilabel)
     else:
-        key_val_metric = ROCAUC(output_transform=partial(output_onehot_transform, n_classes=opts.output_nc))
+        key_val_metric = ROCAUC(output_transform=onehot_transform)
 
     evaluator = SiameseEvaluator(
         device=device,
@@ -181,13 +187,13 @@ def build_siamese_engine(**kwargs):
         ),
         StatsHandler(
             tag_name="train_loss",
-            output_transform=lambda x: x[loss_],
+            output_transform=itemgetter(loss_),
             name=logger_name
         ),
         TensorBoardStatsHandler(
             summary_writer=writer,
             tag_name="train_loss",
-            output_transform=lambda x: x[loss_]
+            output_transform=itemgetter(loss_)
         ),
         CheckpointSaverEx(
             save_dir=os.path.join(model_dir, "Checkpoint"),
@@ -198,8 +204,8 @@ def build_siamese_engine(**kwargs):
         ),
         TensorBoardImageHandlerEx(
             summary_writer=writer,
-            batch_transform=lambda x: (None, None),
-            output_transform=lambda x: x[image_],
+            batch_transform=_no_batch,
+            output_transform=itemgetter(image_),
             max_channels=3,
             prefix_name='Train'
         )
@@ -1,39 +1,81 @@
+import copy
+import os
 import re
+import warnings
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from operator import itemgetter
+from pathlib import Path
 from monai.networks import one_hot
 import torch
+from monai_ex.handlers import CheckpointLoaderEx
 from monai_ex.handlers import from_engine_ex as from_engine
+from monai_ex.inferers import SimpleInfererEx
+from strix.utilities.enum import BCE_LIKE_LOSSES, CE_LIKE_LOSSES
+from strix.utilities.streams import record_stream
 
-def get_best_model(folder, float_regex=r"=(-?\d+\.\d+).pt"):
-    models = list(
-        filter(
-            lambda x: x.is_file(),
-            [model for model in (folder / "Models" / "Best_Models").iterdir()],
-        )
-    )
-    if len(models) == 0:
+FLOAT_REGEX = re.compile(r"=(-?\d+\.\d+)\.pt")
+INT_REGEX = re.compile(r"=(\d+)\.pt")
+
+
+def _iter_files(folder):
+    # scandir entries carry the file type, so no extra stat() per checkpoint
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file():
+                yield Path(entry.path)
+
+
+def get_best_model(folder, float_regex=FLOAT_REGEX):
+    """Return the best model in `folder`/Models/Best_Models, scored by the metric in its filename.
+
+    Returns None if the folder has no files. Files without a metric value are skipped
+    with a warning, and FileNotFoundError is raised if none of the files has one.
+    """
+    float_regex = re.compile(float_regex)
+    scored, invalid_models = [], []
+    for model in _iter_files(folder / "Models" / "Best_Models"):
+        match = float_regex.search(model.name)
+        if match is None:
+            invalid_models.append(model)
+        else:
+            scored.append((float(match.group(1)), model))
+
+    if len(scored) == 0:
+        if invalid_models:
+            raise FileNotFoundError(
+                f"No best model matching '{float_regex.pattern}' in {folder / 'Models' / 'Best_Models'}, "
+                f"got {[m.name for m in invalid_models]}"
+            )
         return None
-    else:
-        models.sort(key=lambda x: float(re.search(float_regex, x.name).group(1)))
-        return models[-1]
+    if invalid_models:
+        warnings.warn(f"Skipped best models without metric value: {[m.name for m in invalid_models]}")
+    return max(scored, key=lambda x: x[0])[1]
 
 
-def get_last_model(folder, int_regex = r"=(\d+).pt"):
-    models = list(
-        filter(
-            lambda x: x.is_file(),
-            [model for model in (folder / "Models" / "Checkpoint").iterdir()],
-        )
-    )
-    try:
-        models.sort(key=lambda x: int(re.search(int_regex, x.name).group(1)))
-    except AttributeError as e:
-        invalid_models = list(
-            filter(lambda x: re.search(int_regex, x.name) is None, models)
-        )
+def get_last_model(folder, int_regex=INT_REGEX):
+    """Return the checkpoint with the largest epoch number in `folder`/Models/Checkpoint.
+
+    Raises AttributeError if any filename has no epoch number, and FileNotFoundError
+    if the folder has no checkpoint.
+    """
+    int_regex = re.compile(int_regex)
+    scored, invalid_models = [], []
+    for model in _iter_files(folder / "Models" / "Checkpoint"):
+        match = int_regex.search(model.name)
+        if match is None:
+            invalid_models.append(model)
+        else:
+            scored.append((int(match.group(1)), model))
+
+    if invalid_models:
         print("invalid models:", invalid_models)
-        raise e
+        raise AttributeError(f"Cannot parse epoch number from {invalid_models}")
+    if len(scored) == 0:
+        raise FileNotFoundError(f"No checkpoint found in {folder / 'Models' / 'Checkpoint'}")
 
-    return models[-1]
+    return max(scored, key=lambda x: x[0])[1]
 
 
 def get_models(folders, model_type):
@@ -51,6 +93,201 @@ def get_models(folders, model_type):
     return best_models
 
 
+def _copy_structure(net):
+    """Deep-copy `net` without copying its parameter values.
+
+    Parameters are seeded in the deepcopy memo with uninitialized tensors, so only the
+    module graph is rebuilt. The copy must get its weights from a checkpoint afterwards.
+    """
+    memo = {
+        id(p): torch.nn.Parameter(torch.empty_like(p), requires_grad=p.requires_grad)
+        for p in net.parameters()
+    }
+    return copy.deepcopy(net, memo)
+
+
+def get_ensemble_networks(net, models, device, logger_name=None):
+    """Return one network per checkpoint in `models`, with its weights loaded, on `device`.
+
+    `net` is reused for the first model and copied for the others, so it must
+    not be shared with another engine. Checkpoints are loaded on a thread pool since
+    torch.load releases the GIL while reading and deserializing. The loading threads
+    work on CPU only; the networks are moved to `device` once all weights are loaded.
+    """
+    if len(models) == 0:
+        return []
+
+    net.to("cpu")
+    nets = [net] + [_copy_structure(net) for _ in models[1:]]
+    with ThreadPoolExecutor(max_workers=min(len(models), 8)) as executor:
+        list(executor.map(
+            lambda n, m: CheckpointLoaderEx(
+                load_path=str(m), load_dict={"net": n}, name=logger_name, map_location="cpu"
+            )(None),
+            nets,
+            models,
+        ))
+    return [n.to(device) for n in nets]
+
+
+def get_ensemble_weights(models):
+    """Ensemble weights parsed from the metric in best-model filenames, normalized to sum to one.
+
+    Returns None (i.e. equal weights) if any filename carries no metric, e.g. a renamed checkpoint.
+    """
+    matches = [FLOAT_REGEX.search(m.name) for m in models]
+    if not all(matches):
+        return None
+    weights = [float(match.group(1)) for match in matches]
+    total = sum(weights)
+    return [w / total for w in weights] if total else weights
+
+
+def jit_network(net, logger=None):
+    """Script `net` with TorchScript and freeze it for inference.
+
+    Must be called after the weights are loaded, since frozen parameters are constants.
+    Networks that cannot be scripted are returned unchanged.
+    """
+    try:
+        scripted = torch.jit.script(net.eval())
+        optimize_fn = getattr(torch.jit, "optimize_for_inference", torch.jit.freeze)
+        return optimize_fn(scripted)
+    except Exception as e:
+        if logger is not None:
+            logger.warning(f"Cannot script {type(net).__name__}, fall back to eager mode: {e}")
+        return net
+
+
+def compile_network(net, logger=None):
+    """Compile `net` with `torch.compile` in "reduce-overhead" mode (CUDA graphs).
+
+    Shapes are treated as static, so inputs should have a fixed crop size. The returned
+    module shares parameters with `net`; keep passing `net` itself to checkpoint handlers,
+    since the compiled module prefixes its state_dict keys. Returns `net` unchanged
+    if `torch.compile` is unavailable (PyTorch < 2.0).
+    """
+    if not hasattr(torch, "compile"):
+        if logger is not None:
+            logger.warning("torch.compile requires PyTorch >= 2.0, fall back to eager mode")
+        return net
+    return torch.compile(net, mode="reduce-overhead", dynamic=False)
+
+
+# torch.autocast(dtype=...) and bfloat16 autocast on CUDA need PyTorch >= 1.10
+_HAS_AUTOCAST_DTYPE = hasattr(torch, "autocast")
+
+
+def get_amp_dtype(device, amp_dtype="auto"):
+    """Return the autocast dtype used when amp is enabled.
+
+    Args:
+        device: device the network runs on.
+        amp_dtype: "float16", "bfloat16" or "auto". "auto" selects bfloat16 on
+            Ampere or newer GPUs (no loss scaling or overflow issues) and float16 otherwise.
+            Always float16 on PyTorch < 1.10, whose autocast has no dtype option.
+    """
+    if not _HAS_AUTOCAST_DTYPE:
+        return torch.float16
+    if amp_dtype in (None, "auto"):
+        device = torch.device(device)
+        if device.type == "cuda" and torch.cuda.get_device_capability(device)[0] >= 8:
+            return torch.bfloat16
+        return torch.float16
+    return getattr(torch, amp_dtype)
+
+
+_inference_mode = getattr(torch, "inference_mode", torch.no_grad)
+
+
+class AutocastInferer(SimpleInfererEx):
+    """SimpleInfererEx running the forward pass under `torch.autocast` with `amp_dtype`.
+
+    Autocast keeps softmax and the losses in float32. On PyTorch < 1.10 it falls back
+    to `torch.cuda.amp.autocast`, which only supports float16.
+    """
+
+    def __init__(self, *args, amp_dtype=torch.float16, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.amp_dtype = amp_dtype
+
+    def __call__(self, inputs, network, *args, **kwargs):
+        if _HAS_AUTOCAST_DTYPE:
+            autocast = torch.autocast("cuda", dtype=self.amp_dtype)
+        else:
+            autocast = torch.cuda.amp.autocast()
+        with autocast:
+            return super().__call__(inputs, network, *args, **kwargs)
+
+
+class InferenceModeInferer:
+    """Run the wrapped inferer under `torch.inference_mode`.
+
+    Lighter than the evaluators' `no_grad` (no version counter or view tracking),
+    so only use it where outputs are never fed back into autograd.
+    Falls back to `torch.no_grad` on PyTorch < 1.9, which has no `inference_mode`.
+    """
+
+    def __init__(self, inferer):
+        self.inferer = inferer
+
+    def __call__(self, *args, **kwargs):
+        with _inference_mode():
+            return self.inferer(*args, **kwargs)
+
+
+class StreamedEnsembleInferer:
+    """Run the wrapped inferer for each network on that network's own CUDA stream.
+
+    `EnsembleEvaluator` calls the inferer once per network. Every network stream waits
+    on one "inputs ready" event, recorded on the calling stream at the first call for
+    a batch, rather than on the calling stream itself. The joins enqueued on the
+    calling stream after each network therefore do not delay the next network, and
+    the fold networks of an ensemble run concurrently. Later work on the calling
+    stream still sees every output. Inputs not on CUDA run the inferer directly.
+    """
+
+    def __init__(self, inferer):
+        self.inferer = inferer
+        self._streams = {}
+        self._inputs = None  # weak reference to the inputs of the current batch
+        self._inputs_ready = None
+
+    def __call__(self, inputs, network, *args, **kwargs):
+        if not (torch.is_tensor(inputs) and inputs.is_cuda):
+            return self.inferer(inputs, network, *args, **kwargs)
+
+        if id(network) not in self._streams:
+            self._streams[id(network)] = torch.cuda.Stream(inputs.device)
+        stream = self._streams[id(network)]
+        current_stream = torch.cuda.current_stream(inputs.device)
+        if self._inputs is None or self._inputs() is not inputs:
+            self._inputs = weakref.ref(inputs)
+            self._inputs_ready = torch.cuda.Event()
+            self._inputs_ready.record(current_stream)
+
+        stream.wait_event(self._inputs_ready)
+        with torch.cuda.stream(stream):
+            outputs = self.inferer(inputs, network, *args, **kwargs)
+        inputs.record_stream(stream)
+        current_stream.wait_stream(stream)
+        record_stream(outputs, current_stream)
+        return outputs
+
+
+def get_simple_inferer(opts, device, *args, inference_mode=False, **kwargs):
+    """Return `AutocastInferer` if amp is enabled on a CUDA device, else `SimpleInfererEx`.
+
+    With `inference_mode`, the inferer is wrapped by `InferenceModeInferer`.
+    """
+    if getattr(opts, "amp", False) and torch.device(device).type == "cuda":
+        amp_dtype = get_amp_dtype(device, getattr(opts, "amp_dtype", "auto"))
+        inferer = AutocastInferer(*args, amp_dtype=amp_dtype, **kwargs)
+    else:
+        inferer = SimpleInfererEx(*args, **kwargs)
+    return InferenceModeInferer(inferer) if inference_mode else inferer
+
+
 # Todo: refactor this function
 def output_onehot_transform(output, n_classes=3, verbose=False):
     y_pred, y = output["pred"], output["label"]
@@ -87,49 +324,162 @@ def output_onehot_transform(output, n_classes=3, verbose=False):
     return pred_, true_
 
 
+def _non_blocking(device, nb=False):
+    """Whether host-to-device copies to `device` can be issued asynchronously.
+
+    Asynchronous copies only overlap with compute when the source tensors are
+    pinned, i.e. the DataLoader is created with ``pin_memory=True``.
+    """
+    return nb or _is_cuda(device)
+
+
+@lru_cache(maxsize=None)
+def _is_cuda(device):
+    # engines pass the same device on every batch, parse it once
+    return torch.device(device).type == "cuda"
+
+
+_COPY_STREAMS = {}
+
+
+def _get_copy_stream(device):
+    """Return the side CUDA stream used for host-to-device copies on `device`."""
+    device = torch.device(device)
+    if device not in _COPY_STREAMS:
+        _COPY_STREAMS[device] = torch.cuda.Stream(device)
+    return _COPY_STREAMS[device]
+
+
+def _on_cuda(batch):
+    return isinstance(batch, dict) and any(torch.is_tensor(v) and v.is_cuda for v in batch.values())
+
+
+def _prepare_on_copy_stream(x, device, nb, prepare_batch_fn):
+    """Issue the copies of `prepare_batch_fn` on a dedicated CUDA stream.
+
+    The consuming stream waits for the copy stream before the batch is returned,
+    and the tensors are recorded on it so the caching allocator does not reuse
+    their memory early. Non-CUDA devices fall through to `prepare_batch_fn`.
+    """
+    if not _is_cuda(device) or _on_cuda(x):
+        # batches already moved by `CUDAPrefetcher` only need casts on the current stream
+        return prepare_batch_fn(x, device, nb)
+
+    copy_stream = _get_copy_stream(device)
+    current_stream = torch.cuda.current_stream(device)
+    with torch.cuda.stream(copy_stream):
+        batch = prepare_batch_fn(x, device, nb)
+    current_stream.wait_stream(copy_stream)
+    record_stream(batch, current_stream)
+    return batch
+
+
+def _with_copy_stream(prepare_batch_fn):
+    return partial(_prepare_on_copy_stream, prepare_batch_fn=prepare_batch_fn)
+
+
+def _tuple_getter(keys):
+    """`itemgetter` over `keys` that always returns a tuple, even for a single key."""
+    if len(keys) == 1:
+        getter = itemgetter(keys[0])
+        return lambda x: (getter(x),)
+    return itemgetter(*keys)
+
+
+def _gather(values, device, nb, dtype=None):
+    """Copy each tensor in `values` to `device` (cast to `dtype` if given), returned as a tuple."""
+    return tuple([v.to(device, dtype=dtype, non_blocking=nb) for v in values])
+
+
+def _prepare_batch(x, device, nb, get_image, get_label, target_dtype):
+    nb = _non_blocking(device, nb)
+    return (
+        get_image(x).to(device, non_blocking=nb),
+        get_label(x).to(device, dtype=target_dtype, non_blocking=nb),
+    )
+
+
+def _prepare_multi_input_batch(x, device, nb, get_inputs, get_label, target_dtype):
+    nb = _non_blocking(device, nb)
+    return (
+        _gather(get_inputs(x), device, nb),
+        get_label(x).to(device, dtype=target_dtype, non_blocking=nb),
+    )
+
+
+def _prepare_multi_output_batch(x, device, nb, get_image, get_outputs, target_dtype):
+    nb = _non_blocking(device, nb)
+    return (
+        get_image(x).to(device, non_blocking=nb),
+        _gather(get_outputs(x), device, nb, target_dtype),
+    )
+
+
+def _prepare_multi_input_output_batch(x, device, nb, get_inputs, get_outputs, target_dtype):
+    nb = _non_blocking(device, nb)
+    return (
+        _gather(get_inputs(x), device, nb),
+        _gather(get_outputs(x), device, nb, target_dtype),
+    )
+
+
+def _prepare_unsupervised_batch(x, device, nb, get_image):
+    return get_image(x).to(device, non_blocking=_non_blocking(device, nb)), None
+
+
+def _prepare_unsupervised_multi_input_batch(x, device, nb, get_inputs):
+    return _gather(get_inputs(x), device, _non_blocking(device, nb)), None
+
+
 def get_prepare_batch_fn(
     opts, image_key, label_key, multi_input_keys, multi_output_keys
-): 
-    target_type = torch.FloatTensor
-    if opts.criterion in ["BCE", "WBCE", "FocalLoss"]:
-        target_type = torch.FloatTensor
-    elif opts.criterion in ["CE", "WCE"]:
-        target_type = torch.LongTensor
+):
+    """Return the `prepare_batch` callable used by the engines.
+
+    On CUDA devices the tensors are copied with ``non_blocking=True`` so that
+    transfers overlap with the previous iteration, and they are issued on a side
+    stream (see `_with_copy_stream`). This requires the DataLoader to return
+    pinned memory (``pin_memory=True``, default in `get_dataloader`).
+    """
+    # cast with .to(device, dtype) rather than .type(torch.LongTensor): the legacy tensor
+    # types are CPU types and would bounce labels already on the device through the host
+    target_dtype = torch.float32
+    if opts.criterion in BCE_LIKE_LOSSES:
+        target_dtype = torch.float32
+    elif opts.criterion in CE_LIKE_LOSSES:
+        target_dtype = torch.long
+
+    # bind the key lookups once, not on every batch
+    if multi_input_keys is not None:
+        input_kwargs = {"get_inputs": _tuple_getter(tuple(multi_input_keys))}
+    else:
+        input_kwargs = {"get_image": itemgetter(image_key)}
+    if multi_output_keys is not None:
+        target_kwargs = {"get_outputs": _tuple_getter(tuple(multi_output_keys))}
+    else:
+        target_kwargs = {"get_label": itemgetter(label_key)}
 
     if multi_input_keys is not None and multi_output_keys is not None:
-        prepare_batch_fn = lambda x, device, nb: (
-            tuple(x[key].to(device) for key in multi_input_keys),
-            tuple(x[key].type(target_type).to(device) for key in multi_output_keys),
-        )
+        prepare_batch_fn = _prepare_multi_input_output_batch
     elif multi_input_keys is not None:
-        prepare_batch_fn = lambda x, device, nb: (
-            tuple(x[key].to(device) for key in multi_input_keys),
-            x[label_key].type(target_type).to(device),
-        )
+        prepare_batch_fn = _prepare_multi_input_batch
     elif multi_output_keys is not None:
-        prepare_batch_fn = lambda x, device, nb: (
-            x[image_key].to(device),
-            tuple(x[key].type(target_type).to(device) for key in multi_output_keys),
-        )
+        prepare_batch_fn = _prepare_multi_output_batch
     else:
-        prepare_batch_fn = lambda x, device, nb: (
-            x[image_key].to(device),
-            x[label_key].type(target_type).to(device),
-        )
+        prepare_batch_fn = _prepare_batch
 
-    return prepare_batch_fn
+    return _with_copy_stream(partial(prepare_batch_fn, **input_kwargs, **target_kwargs, target_dtype=target_dtype))
 
 
 def get_unsupervised_prepare_batch_fn(opts, image_key, multi_input_keys):
     if multi_input_keys is not None:
-        prepare_batch_fn = lambda x, device, nb: (
-            tuple(x[key].to(device) for key in multi_input_keys),
-            None,
+        prepare_batch_fn = partial(
+            _prepare_unsupervised_multi_input_batch, get_inputs=_tuple_getter(tuple(multi_input_keys))
         )
     else:
-        prepare_batch_fn = lambda x, device, nb: (x[image_key].to(device), None)
+        prepare_batch_fn = partial(_prepare_unsupervised_batch, get_image=itemgetter(image_key))
 
-    return prepare_batch_fn
+    return _with_copy_stream(prepare_batch_fn)
 
 
 def get_dice_metric_transform_fn(output_nc, pred_key, label_key, decollate):
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+import torch
+from ignite.engine import Engine, Events
+from ignite.handlers.checkpoint import BaseSaveHandler
+
+from strix.models.cnn.engines.engine import AsyncSaveHandler
+
+
+class FakeSaveHandler(BaseSaveHandler):
+    def __init__(self, fail_on=None, delay=0.0):
+        self.dirname = "/fake/Checkpoint"
+        self.fail_on = fail_on
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, checkpoint, filename, metadata=None):
+        time.sleep(self.delay)
+        if filename == self.fail_on:
+            raise OSError(f"cannot write {filename}")
+        self.calls.append(("save", filename, checkpoint["w"].clone()))
+
+    def remove(self, filename):
+        self.calls.append(("remove", filename))
+
+
+def test_async_save_handler_order():
+    saver = FakeSaveHandler(delay=0.05)
+    handler = AsyncSaveHandler(saver)
+    weights = torch.zeros(2)
+
+    handler({"w": weights}, "epoch=1.pt")
+    weights += 1  # updated while the first write is pending
+    handler.remove("epoch=1.pt")
+    handler({"w": weights}, "epoch=2.pt")
+    handler.close()
+
+    assert [c[:2] for c in saver.calls] == [("save", "epoch=1.pt"), ("remove", "epoch=1.pt"), ("save", "epoch=2.pt")]
+    assert saver.calls[0][2].tolist() == [0, 0]
+    assert saver.calls[2][2].tolist() == [1, 1]
+    assert handler.dirname == "/fake/Checkpoint"
+
+
+def test_async_save_handler_error():
+    handler = AsyncSaveHandler(FakeSaveHandler(fail_on="epoch=1.pt"))
+
+    handler({"w": torch.zeros(2)}, "epoch=1.pt")
+    with pytest.raises(OSError):
+        handler({"w": torch.zeros(2)}, "epoch=2.pt")
+
+    handler({"w": torch.zeros(2)}, "epoch=1.pt")
+    with pytest.raises(OSError):
+        handler.close()
+
+
+@pytest.mark.parametrize("stop", ["complete", "terminate", "raise"])
+def test_async_save_handler_flush_on_exit(stop):
+    saver = FakeSaveHandler(delay=0.05)
+    handler = AsyncSaveHandler(saver)
+
+    def step(engine, batch):
+        if stop == "raise" and engine.state.iteration == 2:
+            raise RuntimeError("training failed")
+
+    engine = Engine(step)
+    handler.attach(engine)
+
+    @engine.on(Events.ITERATION_COMPLETED)
+    def save(engine):
+        handler({"w": torch.zeros(2)}, f"iteration={engine.state.iteration}.pt")
+        if stop == "terminate":
+            engine.terminate()
+
+    if stop == "raise":
+        with pytest.raises(RuntimeError):
+            engine.run(range(3), max_epochs=1)
+    else:
+        engine.run(range(3), max_epochs=1)
+
+    expected = {"complete": 3, "terminate": 1, "raise": 1}[stop]
+    assert [c[1] for c in saver.calls] == [f"iteration={i}.pt" for i in range(1, expected + 1)]
+    assert handler._executor is None
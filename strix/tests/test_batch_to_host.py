@@ -0,0 +1,61 @@
+import pytest
+import torch
+
+from strix.utilities.transforms import BatchToHost
+
+
+def test_batch_to_host_cpu_passthrough():
+    items = [torch.rand(2, 3), torch.rand(2, 3)]
+    assert BatchToHost()(items) is items
+
+
+def test_batch_to_host_stack():
+    items = [torch.full((2, 3), float(i)) for i in range(4)]
+
+    host = BatchToHost()._to_host(items)
+
+    assert host.shape == (4, 2, 3)
+    for i, item in enumerate(items):
+        assert torch.equal(host[i], item)
+
+
+def test_batch_to_host_buffer_growth():
+    to_host = BatchToHost()
+
+    small = to_host._to_host([torch.ones(2, 3), torch.ones(2, 3)])
+    assert to_host._buffer.numel() == 12
+
+    large = to_host._to_host([torch.full((2, 3), 2.0)] * 4)
+    assert to_host._buffer.numel() == 24
+    buffer_ptr = to_host._buffer.data_ptr()
+
+    smaller = to_host._to_host([torch.full((2, 3), 3.0)])
+    assert to_host._buffer.data_ptr() == buffer_ptr  # reused, not reallocated
+
+    assert small.shape == (2, 2, 3) and torch.all(small == 1)
+    assert large.shape == (4, 2, 3) and torch.all(large == 2)
+    assert smaller.shape == (1, 2, 3) and torch.all(smaller == 3)
+
+
+def test_batch_to_host_no_alias():
+    to_host = BatchToHost()
+
+    first = to_host._to_host([torch.zeros(3), torch.zeros(3)])
+    to_host._to_host([torch.ones(3), torch.ones(3)])
+
+    buffer_start = to_host._buffer.data_ptr()
+    buffer_end = buffer_start + to_host._buffer.numel() * to_host._buffer.element_size()
+    assert not buffer_start <= first.data_ptr() < buffer_end
+    assert torch.all(first == 0)
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires CUDA")
+def test_batch_to_host_cuda():
+    items = [torch.full((2, 3), float(i), device="cuda") for i in range(3)]
+
+    host = BatchToHost()(items)
+
+    assert isinstance(host, list) and len(host) == 3
+    for i, item in enumerate(host):
+        assert item.device.type == "cpu"
+        assert torch.all(item == i)
@@ -23,4 +23,10 @@ def test_choices_list_in_prompt(runner, monkeypatch):
 
     result = runner.invoke(cli_without_choices, [], input="none")
     print(result.output)
-    assert "(1: none, 2: day, 3: week, 4: month)" not in result.output
\ No newline at end of file
+    assert "(1: none, 2: day, 3: week, 4: month)" not in result.output
+
+def test_non_decimal_digit_input_fails_cleanly():
+    choice = Choice(["none", "day"])
+    with pytest.raises(click.BadParameter):
+        choice.convert("²", None, None)
+    assert choice.convert(" 2 ", None, None) == "day"
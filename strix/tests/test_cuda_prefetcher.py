@@ -0,0 +1,52 @@
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from strix.utilities.prefetcher import CUDAPrefetcher
+
+
+def make_loader():
+    data = [{"image": torch.full((1, 4, 4), i, dtype=torch.float), "label": torch.tensor(i)} for i in range(5)]
+    for item in data:
+        item["image_meta_dict"] = {"filename_or_obj": f"{int(item['label'])}.nii"}
+    return DataLoader(data, batch_size=2, shuffle=False)
+
+
+def test_cuda_prefetcher_cpu_passthrough():
+    loader = make_loader()
+    prefetcher = CUDAPrefetcher(loader, "cpu", ["image", "label"])
+
+    batches = list(prefetcher)
+    expected = list(loader)
+
+    assert len(batches) == len(expected) == 3
+    for batch, ref in zip(batches, expected):
+        assert batch.keys() == ref.keys()
+        assert batch["image"].device.type == "cpu"
+        assert torch.equal(batch["image"], ref["image"])
+        assert torch.equal(batch["label"], ref["label"])
+
+
+def test_cuda_prefetcher_len_and_attributes():
+    loader = make_loader()
+    prefetcher = CUDAPrefetcher(loader, torch.device("cpu"), ["image"])
+
+    assert len(prefetcher) == len(loader) == 3
+    assert prefetcher.dataset is loader.dataset
+    assert prefetcher.sampler is loader.sampler
+    assert prefetcher.batch_size == 2
+    with pytest.raises(AttributeError):
+        prefetcher.not_a_loader_attribute
+
+
+requires_cuda = pytest.mark.skipif(not torch.cuda.is_available(), reason="requires CUDA")
+
+
+@pytest.mark.parametrize("device", ["cpu", pytest.param("cuda:0", marks=requires_cuda)])
+def test_cuda_prefetcher_keeps_other_items(device):
+    prefetcher = CUDAPrefetcher(make_loader(), device, ["image"])
+
+    for batch in prefetcher:
+        assert batch["image"].device == torch.device(device)
+        assert batch["label"].device.type == "cpu"
+        assert batch["image_meta_dict"]["filename_or_obj"][0].endswith(".nii")
@@ -0,0 +1,91 @@
+import pytest
+
+import torch
+
+from strix.utilities.utils import get_bound_2d, draw_segmentation_contour
+
+OFFSETS = {
+    1: [(0, 0, 1), (0, 0, -1), (0, 1, 0), (0, -1, 0)],
+    2: [(0, 0, 1), (0, 0, -1), (0, 1, 0), (0, -1, 0), (0, 1, 1), (0, 1, -1), (0, -1, -1), (0, -1, 1)],
+}
+
+
+def reference_bound(data, coords, offsets):
+    """Per-pixel neighbor lookup, as get_bound_2d did before it was vectorized."""
+    bound = []
+    for coord in coords:
+        zeros = []
+        for off in offsets:
+            pt = tuple(coord + torch.tensor(off))
+            try:
+                zeros.append(bool(data[pt] == 0))
+            except IndexError:
+                zeros.append(True)
+        if any(zeros):
+            bound.append(coord)
+    return bound
+
+
+def reference_get_bound_2d(mask, connectivity):
+    offsets = OFFSETS[connectivity]
+    if mask.ndim == 3 and mask.shape[0] > 1:
+        return [
+            reference_bound(channel[None], torch.nonzero(channel[None]), offsets)
+            for channel in mask[1:]
+            if channel.any()
+        ]
+    return [reference_bound(mask, torch.nonzero(mask == label), offsets) for label in mask[mask > 0].unique()]
+
+
+def as_lists(boundaries):
+    return [[coord.tolist() for coord in bound] for bound in boundaries]
+
+
+@pytest.mark.parametrize("connectivity", [1, 2])
+def test_get_bound_2d_multichannel(connectivity):
+    torch.manual_seed(0)
+    mask = torch.zeros(4, 9, 11, dtype=torch.bool)
+    mask[1] = torch.rand(9, 11) > 0.5
+    mask[3, 2:9, 3:11] = True  # touches the bottom and right edges, channel 2 stays empty
+
+    boundaries = get_bound_2d(mask, connectivity=connectivity)
+
+    assert len(boundaries) == 2
+    assert all(isinstance(bound, list) for bound in boundaries)
+    assert as_lists(boundaries) == as_lists(reference_get_bound_2d(mask, connectivity))
+
+
+@pytest.mark.parametrize("connectivity", [1, 2])
+def test_get_bound_2d_labelled(connectivity):
+    mask = torch.zeros(1, 10, 12, dtype=torch.long)
+    mask[0, 0:4, 0:5] = 1  # touches the top and left edges
+    mask[0, 5:10, 2:11] = 2  # touches the bottom edge, below label 1 at the wrap-around
+    mask[0, 6:8, 4:6] = 3  # surrounded by label 2, no zero neighbor
+
+    boundaries = get_bound_2d(mask, connectivity=connectivity)
+
+    assert len(boundaries) == 3
+    assert as_lists(boundaries) == as_lists(reference_get_bound_2d(mask, connectivity))
+    assert boundaries[2] == []
+
+
+@pytest.mark.parametrize("connectivity", [1, 2])
+def test_get_bound_2d_random_labels(connectivity):
+    torch.manual_seed(1)
+    mask = torch.randint(0, 4, (1, 7, 8))
+
+    boundaries = get_bound_2d(mask, connectivity=connectivity)
+
+    assert as_lists(boundaries) == as_lists(reference_get_bound_2d(mask, connectivity))
+
+
+def test_draw_segmentation_contour_coords():
+    image = torch.zeros(3, 10, 16, dtype=torch.uint8)
+    mask = torch.zeros(1, 10, 16, dtype=torch.bool)
+    mask[0, 2:5, 3:13] = True  # not square, so swapped (y, x) would miss pixels
+
+    out = draw_segmentation_contour(image, mask, radius=1, colors=[(255, 0, 0), (0, 255, 0)])
+
+    for _, y, x in as_lists(reference_get_bound_2d(mask, 1))[0]:
+        assert out[:, y, x].tolist() == [255, 0, 0]
+    assert out[:, 8, 1].tolist() == [0, 0, 0]
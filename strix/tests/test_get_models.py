@@ -0,0 +1,70 @@
+import pytest
+
+from strix.models.cnn.engines.utils import get_best_model, get_last_model
+
+
+@pytest.mark.parametrize(
+    "filenames, expected",
+    [
+        (["net_key_metric=0.8123.pt", "net_key_metric=0.9001.pt", "net_key_metric=-0.5.pt"], "net_key_metric=0.9001.pt"),
+        (["net_key_metric=-0.5.pt", "net_key_metric=-0.25.pt"], "net_key_metric=-0.25.pt"),
+        ([], None),
+    ],
+)
+def test_get_best_model(filenames, expected, tmp_path):
+    (tmp_path / "Models" / "Best_Models").mkdir(parents=True)
+    for filename in filenames:
+        (tmp_path / "Models" / "Best_Models" / filename).touch()
+    (tmp_path / "Models" / "Best_Models" / "subdir=0.99.pt").mkdir()
+
+    best_model = get_best_model(tmp_path)
+
+    assert (best_model.name if best_model else None) == expected
+
+
+def test_get_best_model_skips_unmatched(tmp_path):
+    (tmp_path / "Models" / "Best_Models").mkdir(parents=True)
+    (tmp_path / "Models" / "Best_Models" / "net_key_metric=0.8123.pt").touch()
+    (tmp_path / "Models" / "Best_Models" / "renamed.pt").touch()
+
+    with pytest.warns(UserWarning):
+        assert get_best_model(tmp_path).name == "net_key_metric=0.8123.pt"
+
+
+def test_get_best_model_all_unmatched(tmp_path):
+    (tmp_path / "Models" / "Best_Models").mkdir(parents=True)
+    (tmp_path / "Models" / "Best_Models" / "renamed.pt").touch()
+
+    with pytest.raises(FileNotFoundError):
+        get_best_model(tmp_path)
+
+
+@pytest.mark.parametrize(
+    "filenames, expected",
+    [
+        (["checkpoint_epoch=9.pt", "checkpoint_epoch=10.pt", "checkpoint_epoch=2.pt"], "checkpoint_epoch=10.pt"),
+        (["checkpoint_epoch=1.pt"], "checkpoint_epoch=1.pt"),
+    ],
+)
+def test_get_last_model(filenames, expected, tmp_path):
+    (tmp_path / "Models" / "Checkpoint").mkdir(parents=True)
+    for filename in filenames:
+        (tmp_path / "Models" / "Checkpoint" / filename).touch()
+
+    assert get_last_model(tmp_path).name == expected
+
+
+@pytest.mark.parametrize(
+    "filenames, error",
+    [
+        ([], FileNotFoundError),
+        (["checkpoint_final.pt"], AttributeError),
+    ],
+)
+def test_get_last_model_invalid(filenames, error, tmp_path):
+    (tmp_path / "Models" / "Checkpoint").mkdir(parents=True)
+    for filename in filenames:
+        (tmp_path / "Models" / "Checkpoint" / filename).touch()
+
+    with pytest.raises(error):
+        get_last_model(tmp_path)
@@ -0,0 +1,19 @@
+from strix.utilities.transforms import LastCallCache
+
+
+def test_last_call_cache():
+    calls = []
+
+    def transform(data):
+        calls.append(data)
+        return data["pred"] * 2
+
+    cached = LastCallCache(transform)
+    batch1, batch2 = {"pred": 1}, {"pred": 1}
+
+    assert cached(batch1) == 2
+    assert cached(batch1) == 2
+    assert len(calls) == 1
+
+    assert cached(batch2) == 2
+    assert len(calls) == 2
@@ -86,6 +86,11 @@ def common_params(func):
     @option("--save-epoch-freq", type=int, default=100, help="Save model freq")
     @option("--save-n-best", type=int, default=3, help="Save best N models")
     @option("--amp", is_flag=True, help="Flag of using amp. Need pytorch1.6")
+    @option(
+        "--amp-dtype", type=Choice(["auto", "float16", "bfloat16"]), default="auto",
+        help="Autocast dtype of amp. 'auto': bfloat16 on Ampere+ GPUs, else float16",
+    )
+    @option("--compile", is_flag=True, help="Compile the network with torch.compile. Need pytorch2.0")
     @option("--nni", is_flag=True, help="Flag of using nni-search, you dont need to modify this")
     @option("--n-fold", type=int, default=0, help="K fold cross-validation")
     @option("--n-repeat", type=int, default=0, help="K times random permutation cross-validator")
@@ -1,4 +1,3 @@
-from lib2to3.pgen2.token import OP
 import typing as t
 from click import Choice, ParamType, Option, Context, Parameter, Command
 from click.core import ParameterSource
@@ -7,6 +6,9 @@ from click.types import convert_type
 
 ###################### Extension of click ################################
 
+# Map "," and ";" to spaces so str.split() handles all three separators at once.
+_TUPLE_SEP_TABLE = str.maketrans(",;", "  ")
+
 
 class ContextEx(Context):
     def __init__(
@@ -145,22 +147,13 @@ class DynamicTuple(ParamType):
         return "< Dynamic Tuple >"
 
     def convert(self, value, param, ctx):
+        if value is None or value == "":
+            return None
         # Hotfix for prompt input
         if isinstance(value, str):
-            if "," in value:
-                sep = ","
-            elif ";" in value:
-                sep = ";"
-            else:
-                sep = " "
+            value = value.translate(_TUPLE_SEP_TABLE).split()
 
-            value = value.strip().split(sep)
-            value = list(filter(lambda x: x != " ", value))
-        elif value is None or value == "":
-            return None
-
-        types = (self.type,) * len(value)
-        return tuple(ty(x, param, ctx) for ty, x in zip(types, value))
+        return tuple(self.type(x, param, ctx) for x in value)
 
 
 class NumericChoice(Choice):
@@ -175,13 +168,15 @@ class NumericChoice(Choice):
                 choicestrs.append(f"{i}: {choice}")
 
         super().__init__(choicestrs, **kwargs)
+        self.choice_values = frozenset(self.choicemap.values())
 
     def convert(self, value, param, ctx):
-        try:
-            return self.choicemap[int(value)]
-        except ValueError as e:
-            if value in self.choicemap.values():
-                return value
-            self.fail(f"invaid index choice: {value}. Please input integer index or correct value!" f"Error msg: {e}")
-        except KeyError as e:
+        if isinstance(value, int) or (isinstance(value, str) and value.strip().isdecimal()):
+            index = int(value)
+            if index in self.choicemap:
+                return self.choicemap[index]
             self.fail(f"invalid choice: {value}. (choose from {self.choicemap})", param, ctx)
+
+        if value in self.choice_values:
+            return value
+        self.fail(f"invaid index choice: {value}. Please input integer index or correct value!", param, ctx)
@@ -69,6 +69,9 @@ class Losses(Enum):
 
 
 LOSSES = get_enums(Losses)
+# loss families by target type, frozen for constant-time membership checks
+BCE_LIKE_LOSSES = frozenset({Losses.BCE.value, Losses.WBCE.value, Losses.FOCAL.value})
+CE_LIKE_LOSSES = frozenset({Losses.CE.value, Losses.WCE.value})
 
 
 class LrSchedule(Enum):
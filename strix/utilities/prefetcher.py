@@ -0,0 +1,63 @@
+from typing import Sequence, Union
+
+import torch
+
+from strix.utilities.streams import record_stream
+
+_END = object()
+
+
+class CUDAPrefetcher:
+    """Iterate a DataLoader while the next batch is copied to `device` on a side CUDA stream.
+
+    The copy of batch i+1 is issued before batch i is handed to the engine, so it overlaps
+    with the computation of batch i. Requires a DataLoader with ``pin_memory=True``.
+    Only the tensors stored under `keys` are moved, other items (e.g. meta dicts) stay on
+    the host for savers and handlers. Other attributes (e.g. ``dataset``) are forwarded
+    to the wrapped loader, and non-CUDA devices iterate the loader as is.
+
+    Args:
+        loader (DataLoader): loader to wrap.
+        device (Union[str, torch.device]): target device of the batches.
+        keys (Sequence[str]): batch keys consumed on the device, e.g. image and label.
+    """
+
+    def __init__(self, loader, device: Union[str, torch.device], keys: Sequence[str]):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.keys = frozenset(keys)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __getattr__(self, name):
+        if name == "loader":
+            raise AttributeError(name)
+        return getattr(self.loader, name)
+
+    def _preload(self, iterator, stream):
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            return _END
+        with torch.cuda.stream(stream):
+            return {
+                k: v.to(self.device, non_blocking=True) if k in self.keys and torch.is_tensor(v) else v
+                for k, v in batch.items()
+            }
+
+    def __iter__(self):
+        if self.device.type != "cuda":
+            yield from self.loader
+            return
+
+        stream = torch.cuda.Stream(self.device)
+        iterator = iter(self.loader)
+        next_batch = self._preload(iterator, stream)
+        while next_batch is not _END:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(stream)
+            batch = next_batch
+            record_stream([batch[k] for k in self.keys if k in batch], current_stream)
+            next_batch = self._preload(iterator, stream)
+            yield batch
@@ -0,0 +1,18 @@
+import torch
+
+
+def record_stream(data, stream):
+    """Record the CUDA tensors in `data` (nested dicts, lists and tuples) on `stream`.
+
+    The caching allocator then does not reuse their memory before the work queued on
+    `stream` is done. Tensors not on CUDA are skipped.
+    """
+    if torch.is_tensor(data):
+        if data.is_cuda:
+            data.record_stream(stream)
+    elif isinstance(data, dict):
+        for item in data.values():
+            record_stream(item, stream)
+    elif isinstance(data, (list, tuple)):
+        for item in data:
+            record_stream(item, stream)
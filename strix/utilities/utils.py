@@ -92,8 +92,10 @@ def get_colors(num: int = None):
 
 
 def bbox_3D(img):
-    r = np.any(img, axis=(1, 2))
-    c = np.any(img, axis=(0, 2))
+    # reuse the row/col projection so the full volume is only scanned twice
+    rc = np.any(img, axis=2)
+    r = np.any(rc, axis=1)
+    c = np.any(rc, axis=0)
     z = np.any(img, axis=(0, 1))
 
     rmin, rmax = np.where(r)[0][[0, -1]]
@@ -442,42 +444,52 @@ def norm_tensor(t, range):
         return norm_ip(t, float(t.min()), float(t.max()))
 
 
-def get_bound_2d(mask, connectivity=1):
-    from joblib import Parallel, delayed
+# (dy, dx) neighbor offsets of each connectivity
+_BOUND_OFFSETS = {
+    1: ((0, 1), (0, -1), (1, 0), (-1, 0)),
+    2: ((0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, -1), (-1, 1)),
+}
 
-    if connectivity == 1:
-        offset = [(0, 0, 1), (0, 0, -1), (0, 1, 0), (0, -1, 0)]
-    elif connectivity == 2:
-        offset = [(0, 0, 1), (0, 0, -1), (0, 1, 0), (0, -1, 0), (0, 1, 1), (0, 1, -1), (0, -1, -1), (0, -1, 1)]
-    else:
-        raise ValueError(f'Connectivity should be 1 or 2, but got {connectivity}')
 
-    def is_bound(data, coord, offsets):
-        zeros = []
-        for off in offsets:
-            pt = tuple(coord + torch.tensor(off))
-            try:
-                zeros.append(data[pt] == 0)
-            except:
-                zeros.append(True)
-        return (coord, np.any(zeros))
+def _boundary_map(data, offsets):
+    """Return a bool map of the nonzero pixels of `data` (1, H, W) with a zero neighbor at any of `offsets`.
+
+    Each offset is a single shifted comparison over the whole image instead of a per-pixel
+    lookup, with the same edge handling as indexing the neighbor: past the bottom or right
+    edge counts as zero, before the top or left edge wraps around.
+    """
+    foreground = data != 0
+    height, width = foreground.shape[-2:]
+    bound = torch.zeros_like(foreground)
+    for dy, dx in offsets:
+        is_zero = ~torch.roll(foreground, shifts=(-dy, -dx), dims=(-2, -1))
+        if dy > 0:
+            is_zero[..., height - dy:, :] = True
+        if dx > 0:
+            is_zero[..., :, width - dx:] = True
+        bound |= is_zero
+    return foreground & bound
+
+
+def get_bound_2d(mask, connectivity=1):
+    offset = _BOUND_OFFSETS.get(connectivity)
+    if offset is None:
+        raise ValueError(f'Connectivity should be 1 or 2, but got {connectivity}')
 
     boundaries = []
     if mask.ndim == 3 and mask.shape[0] > 1:
         for channel in mask[1:,...]:
-            coords = torch.nonzero(channel[None])
-            if len(coords) == 0:
+            if not channel.any():
                 continue
-            bounds = Parallel(n_jobs=5)(delayed(is_bound)(channel[None], c, offset) for c in coords)
-            boundary = list(filter(lambda x: x[1], bounds))
-            boundaries.append(list(map(lambda x: x[0], boundary)))
+            coords = torch.nonzero(_boundary_map(channel[None], offset))
+            boundaries.append(list(coords))
     else:
-        labels = np.unique(mask[mask > 0])
+        coords = torch.nonzero(_boundary_map(mask, offset))
+        coord_labels = mask[tuple(coords.T)]  # split the boundary pixels instead of rescanning the mask per label
+        labels = mask.unique()
+        labels = labels[labels > 0]
         for label in labels:
-            coords = torch.nonzero(mask == label)
-            bounds = Parallel(n_jobs=5)(delayed(is_bound)(mask, c, offset) for c in coords)
-            boundary = list(filter(lambda x: x[1], bounds))
-            boundaries.append(list(map(lambda x: x[0], boundary)))
+            boundaries.append(list(coords[coord_labels == label]))
     return boundaries
 
 